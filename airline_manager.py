@@ -5,6 +5,8 @@ import json
 import shutil
 import subprocess
 import time
+import contextlib
+import threading
 from pathlib import Path
 
 WORKDIR = Path("/home/kali/airline-club-manager-test").resolve()
@@ -38,9 +40,21 @@ DEFAULTS = {
     "web_port": 9000,
 }
 
+# Set by run_plan: prompts take their defaults instead of blocking on stdin
+UNATTENDED = False
+_dirs_ready = False
+_tool_cache = {}
+# Serializes manager_state.json writes from parallel plan steps
+_state_lock = threading.Lock()
+
+
 def ensure_dirs():
+    global _dirs_ready
+    if _dirs_ready:
+        return
     LOG_DIR.mkdir(parents=True, exist_ok=True)
     PID_DIR.mkdir(parents=True, exist_ok=True)
+    _dirs_ready = True
 
 
 def load_state():
@@ -54,8 +68,11 @@ def load_state():
 
 
 def save_state(state):
-    with STATE_FILE.open("w") as f:
-        json.dump(state, f, indent=2)
+    with _state_lock:
+        text = json.dumps(state, indent=2)
+        tmp = STATE_FILE.with_name(STATE_FILE.name + ".tmp")
+        tmp.write_text(text)
+        os.replace(tmp, STATE_FILE)
 
 
 def log(msg):
@@ -75,7 +92,8 @@ def run(cmd, cwd=None, log_file_name=None, background=False, use_sudo=False):
         lfpath = LOG_DIR / (log_file_name or "background.log")
         lf = lfpath.open("a")
         args = (["sudo", "-S", "bash", "-lc", cmd] if (use_sudo and os.geteuid() != 0) else ["bash", "-lc", cmd])
-        proc = subprocess.Popen(args, cwd=str(cwd or WORKDIR), stdout=lf, stderr=lf, env=env)
+        # Own session/process group so stop can signal the wrapper, sbt and the JVM together
+        proc = subprocess.Popen(args, cwd=str(cwd or WORKDIR), stdout=lf, stderr=lf, env=env, start_new_session=True)
         return proc
     else:
         log(f"Running: {launcher} '{cmd}' (cwd={cwd or WORKDIR})")
@@ -85,7 +103,20 @@ def run(cmd, cwd=None, log_file_name=None, background=False, use_sudo=False):
 
 
 def which(cmd):
-    return shutil.which(cmd) is not None
+    # Only hits are cached; misses are looked up again since install steps can add tools
+    if cmd not in _tool_cache:
+        path = shutil.which(cmd)
+        if path is None:
+            return False
+        _tool_cache[cmd] = path
+    return True
+
+
+def ask(prompt, default=""):
+    if UNATTENDED:
+        log(f"Unattended: taking default for prompt: {prompt.strip()}")
+        return default
+    return input(prompt)
 
 
 # --- Operations ---
@@ -203,7 +234,7 @@ def op_create_db(state):
             code = _mysql_exec(alt, root_user, root_pass)
         if code != 0:
             log("MySQL command failed. If this is due to auth, please enter MySQL root password.")
-            root_pass = input("Enter MySQL root password (leave blank to retry without): ")
+            root_pass = ask("Enter MySQL root password (leave blank to retry without): ", root_pass)
             cfg["mysql_root_pass"] = root_pass
             save_state(state)
             code = _mysql_exec(sql, root_user, root_pass)
@@ -400,10 +431,233 @@ server {{
         return False
 
 
+# --- Process management ---
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Zombies still answer signal 0 but have already exited
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def _process_table():
+    """Map pid -> (ppid, pgid) from /proc."""
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            table[int(entry)] = (int(fields[1]), int(fields[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+    return table
+
+
+def process_tree(pid):
+    """pid, its descendants and its process group members (the sudo/bash wrapper, sbt and the JVM)."""
+    table = _process_table()
+    if pid not in table:
+        return []
+    found, queue = {pid}, [pid]
+    while queue:
+        parent = queue.pop()
+        for child, (ppid, _) in table.items():
+            if ppid == parent and child not in found:
+                found.add(child)
+                queue.append(child)
+    pgid = table[pid][1]
+    if pgid == pid:
+        found.update(p for p, (_, g) in table.items() if g == pgid)
+    return sorted(found)
+
+
+def _signal_pids(pids, sig):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            # Started through sudo; the children belong to root
+            subprocess.run(["sudo", "-n", "kill", f"-{int(sig)}", str(pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _wait_for_exit(pids, timeout):
+    deadline = time.time() + timeout
+    alive = [p for p in pids if _pid_alive(p)]
+    while alive and time.time() < deadline:
+        time.sleep(0.2)
+        alive = [p for p in alive if _pid_alive(p)]
+    return alive
+
+
+def _listening_inodes(port):
+    inodes = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # st 0A = LISTEN
+                    if fields[3] == "0A" and int(fields[1].rsplit(":", 1)[1], 16) == int(port):
+                        inodes.add(fields[9])
+        except (OSError, StopIteration):
+            continue
+    return inodes
+
+
+def port_listening(port):
+    """True if something is listening on the TCP port (read from /proc/net/tcp and tcp6)."""
+    return bool(_listening_inodes(port))
+
+
+def port_owners(port):
+    """PIDs holding a listening socket on port, as far as /proc/<pid>/fd is readable."""
+    targets = {f"socket:[{i}]" for i in _listening_inodes(port)}
+    owners = []
+    for entry in os.listdir("/proc") if targets else []:
+        if not entry.isdigit():
+            continue
+        try:
+            fds = os.listdir(f"/proc/{entry}/fd")
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(f"/proc/{entry}/fd/{fd}") in targets:
+                    owners.append(int(entry))
+                    break
+            except OSError:
+                continue
+    return owners
+
+
+def _cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return [a.decode("utf-8", "replace") for a in f.read().split(b"\0") if a]
+    except OSError:
+        return []
+
+
+def _process_start_time(pid):
+    """Wall-clock start time of pid from /proc, or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            btime = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return btime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def _is_service_wrapper(pid, pid_file):
+    """True if pid leads its own session (background services start with start_new_session) and is the
+    bash/sudo launcher of sbt or activator. If bash has exec'd further, a process that started before
+    the PID file was written also counts, since a reused PID always starts later."""
+    try:
+        if os.getsid(pid) != pid:
+            return False
+    except OSError:
+        return False
+    argv = _cmdline(pid)
+    if argv and os.path.basename(argv[0]) in ("bash", "sh", "sudo", "java"):
+        words = [os.path.basename(w) for a in argv[1:] for w in a.split()]
+        if any(w in ("sbt", "activator") or w.startswith("sbt-launch") for w in words):
+            return True
+    started = _process_start_time(pid)
+    return started is not None and started <= pid_file.stat().st_mtime + 1
+
+
+def service_pid(name):
+    """PID from pids/<name>.pid if it is still the service the manager started; stale files are removed."""
+    pid_file = PID_DIR / f"{name}.pid"
+    if not pid_file.exists():
+        return None
+    try:
+        pid = int(pid_file.read_text().strip())
+    except ValueError:
+        pid_file.unlink()
+        log(f"Removed unreadable {name} PID file.")
+        return None
+    if not _pid_alive(pid):
+        log(f"{name} PID {pid} is not running; removing stale PID file.")
+        pid_file.unlink()
+        return None
+    if not _is_service_wrapper(pid, pid_file):
+        # PID reused by an unrelated process (or started by an older manager without its own session)
+        log(f"{name} PID {pid} is not a manager-started sbt/activator process; treating PID file as stale.")
+        pid_file.unlink()
+        return None
+    return pid
+
+
+def _tree_has_jvm(pid):
+    return any(os.path.basename((_cmdline(p) or [""])[0]) == "java" for p in process_tree(pid))
+
+
+def stop_service(name, port=None, grace=30, port_timeout=30):
+    """TERM the whole process tree behind pids/<name>.pid, KILL what outlives the grace period,
+    then wait for the port to be released. Returns True once everything is gone."""
+    pid_file = PID_DIR / f"{name}.pid"
+    if not pid_file.exists():
+        log(f"No {name} PID file found.")
+    pid = service_pid(name)
+    if pid is None:
+        if port and port_listening(port):
+            log(f"Port {port} is still in use by a process the manager does not track (PIDs: {port_owners(port) or 'unknown'}).")
+            return False
+        return True
+    # Snapshot the tree before signalling; once the wrapper exits its children are reparented
+    pids = process_tree(pid)
+    if pids:
+        log(f"Stopping {name}: SIGTERM to PIDs {', '.join(map(str, pids))}")
+        _signal_pids(pids, 15)
+        alive = _wait_for_exit(pids, grace)
+        if alive:
+            log(f"{name}: PIDs {', '.join(map(str, alive))} still running after {grace}s; sending SIGKILL")
+            _signal_pids(alive, 9)
+            alive = _wait_for_exit(alive, 10)
+        if alive:
+            log(f"Failed to stop {name}: PIDs {', '.join(map(str, alive))} survived SIGKILL.")
+            return False
+        log(f"{name} stopped.")
+    if pid_file.exists():
+        pid_file.unlink()
+    if port:
+        deadline = time.time() + port_timeout
+        while port_listening(port) and time.time() < deadline:
+            time.sleep(0.5)
+        if port_listening(port):
+            log(f"Port {port} is still in use after stopping {name} (PIDs: {port_owners(port) or 'unknown'}).")
+            return False
+    return True
+
+
 def op_start_web(state):
     web_dir = REPO_DIR / "airline-web"
     host = state["config"].get("web_host", "0.0.0.0")
     port = state["config"].get("web_port", 9000)
+    running = service_pid("web")
+    if running:
+        log(f"Web server is already running (PID {running}); run stop_web (or restart web) first.")
+        return False
+    if port_listening(port):
+        log(f"Port {port} is already in use (PIDs: {port_owners(port) or 'unknown'}); run stop_web (or restart web) first.")
+        return False
     log(f"Starting airline-web server on {host}:{port} as background...")
     if which("activator"):
         cmd = f"activator -Dhttp.port={port} -Dhttp.address={host} run"
@@ -413,25 +667,79 @@ def op_start_web(state):
     pid_file = PID_DIR / "web.pid"
     pid_file.write_text(str(proc.pid))
     log(f"Web server started with PID {proc.pid}. Logs -> {LOG_DIR / 'web.log'} (expected at http://{host}:{port})")
+    return True
 
 
-def op_stop_web():
-    pid_file = PID_DIR / "web.pid"
-    if not pid_file.exists():
-        log("No web server PID file found.")
-        return
-    pid = int(pid_file.read_text().strip())
-    try:
-        os.kill(pid, 15)  # SIGTERM
-        log(f"Sent SIGTERM to web server PID {pid}.")
-    except Exception as e:
-        log(f"Failed to stop web server: {e}")
+def op_stop_web(state=None):
+    state = state or load_state()
+    return stop_service("web", port=state["config"].get("web_port", 9000))
+
+
+RESTART_TARGETS = ("web", "simulation", "all")
+
+
+def op_restart(state, target="all", wait=300):
+    """Stop and start web and/or simulation, reporting how long each phase took."""
+    if target not in RESTART_TARGETS:
+        log(f"Unknown restart target: {target} (choose {', '.join(RESTART_TARGETS)})")
+        return False
+    targets = ["simulation", "web"] if target == "all" else [target]
+    ok = True
+    for t in targets:
+        started = time.time()
+        stopped = op_stop_web(state) if t == "web" else op_stop_simulation()
+        shutdown = time.time() - started
+        if not stopped:
+            log(f"{t}: shutdown failed after {shutdown:.1f}s; not starting a second copy.")
+            ok = False
+            continue
+        started = time.time()
+        if t == "web":
+            up = op_start_web(state)
+            port = state["config"].get("web_port", 9000)
+            # sbt run compiles before Play binds the port
+            deadline = started + float(wait)
+            pid = int((PID_DIR / "web.pid").read_text().strip()) if up else None
+            while up and not port_listening(port) and time.time() < deadline:
+                if not _pid_alive(pid):
+                    break
+                time.sleep(1)
+            up = up and port_listening(port)
+            note = "" if up else " (FAILED to come up; see logs)"
+        else:
+            log_path = LOG_DIR / "simulation.log"
+            offset = log_path.stat().st_size if log_path.exists() else 0
+            up = op_start_simulation(state)
+            pid = int((PID_DIR / "simulation.pid").read_text().strip()) if up else None
+            # Started means the first "cycle N starting!" from the new process (sbt compiles first)
+            deadline = started + float(wait)
+            cycle_started = False
+            while up and time.time() < deadline:
+                with log_path.open("rb") as f:
+                    f.seek(offset)
+                    cycle_started = b" starting!" in f.read()
+                if cycle_started or not _pid_alive(pid):
+                    break
+                time.sleep(1)
+            if cycle_started:
+                note = ""
+            elif up and _pid_alive(pid) and _tree_has_jvm(pid):
+                note = f" (JVM running, no cycle started within {float(wait):.0f}s)"
+            else:
+                up = False
+                note = " (FAILED to come up; see logs)"
+        startup = time.time() - started
+        log(f"{t}: shutdown {shutdown:.1f}s, startup {startup:.1f}s{note}")
+        ok = ok and up
+    return ok
 
 
 def op_uninstall(state):
     log("Stopping services and removing cloned repo...")
-    op_stop_simulation()
-    op_stop_web()
+    stopped = op_stop_simulation()
+    stopped = op_stop_web(state) and stopped
+    if not stopped:
+        log("Some services could not be stopped; check for leftover java processes.")
     if REPO_DIR.exists():
         try:
             shutil.rmtree(REPO_DIR)
@@ -441,6 +749,7 @@ def op_uninstall(state):
     # Reset state
     save_state({"steps": {}, "config": DEFAULTS.copy()})
     log("Uninstall completed (state reset).")
+    return stopped
 
 
 def print_menu(state):
@@ -501,7 +810,7 @@ def run_step_by_name(state, step):
 
 
 def op_set_map_key(state):
-    key = input("Enter Google Map API key (press Enter to skip): ").strip()
+    key = ask("Enter Google Map API key (press Enter to skip): ").strip()
     if not key:
         log("Skipped setting map key.")
         state["steps"]["set_map_key"] = False
@@ -525,6 +834,10 @@ def op_init_db_data(state):
 
 def op_start_simulation(state):
     data_dir = REPO_DIR / "airline-data"
+    running = service_pid("simulation")
+    if running:
+        log(f"Simulation is already running (PID {running}); run stop_simulation (or restart simulation) first.")
+        return False
     log("Starting background simulation (MainSimulation) as background...")
     if which("activator"):
         cmd = "activator 'runMain com.patson.MainSimulation'"
@@ -534,54 +847,46 @@ def op_start_simulation(state):
     pid_file = PID_DIR / "simulation.pid"
     pid_file.write_text(str(proc.pid))
     log(f"Simulation started with PID {proc.pid}. Logs -> {LOG_DIR / 'simulation.log'}")
+    return True
 
 
 def op_stop_simulation():
-    pid_file = PID_DIR / "simulation.pid"
-    if not pid_file.exists():
-        log("No simulation PID file found.")
-        return
-    try:
-        pid = int(pid_file.read_text().strip())
-        os.kill(pid, 15)  # SIGTERM
-        log(f"Sent SIGTERM to simulation PID {pid}.")
-    except Exception as e:
-        log(f"Failed to stop simulation: {e}")
+    return stop_service("simulation")
 
 
 def op_config_host_port(state):
-    host = input("Enter host/address (default 0.0.0.0): ").strip() or "0.0.0.0"
-    port = input("Enter port (default 9000): ").strip() or "9000"
+    host = ask("Enter host/address (default 0.0.0.0): ").strip() or "0.0.0.0"
+    port = ask("Enter port (default 9000): ").strip() or "9000"
     return op_config_host_port_values(state, host, port)
 
 
 def op_config_banner(state):
-    val = input("Enable banner? (yes/no, default no): ").strip().lower()
+    val = ask("Enable banner? (yes/no, default no): ").strip().lower()
     if not val:
         val = "no"
     return op_config_banner_value(state, val)
 
 
 def op_config_elasticsearch(state):
-    use_es_input = input("Enable Elasticsearch-backed flight search? (yes/no, default no): ").strip().lower()
+    use_es_input = ask("Enable Elasticsearch-backed flight search? (yes/no, default no): ").strip().lower()
     if not use_es_input:
         use_es_input = "no"
     es_host = "localhost"
     es_port = "9200"
     if use_es_input in ("y","yes","true","1"):
-        es_host = input("Elasticsearch host (default localhost): ").strip() or "localhost"
-        es_port = input("Elasticsearch port (default 9200): ").strip() or "9200"
+        es_host = ask("Elasticsearch host (default localhost): ").strip() or "localhost"
+        es_port = ask("Elasticsearch port (default 9200): ").strip() or "9200"
     return op_config_elasticsearch_values(state, use_es_input, es_host, es_port)
 
 
 def op_setup_reverse_proxy(state):
-    domain = input("Enter domain (e.g., domain.com): ").strip()
+    domain = ask("Enter domain (e.g., domain.com): ").strip()
     default_port = str(state['config'].get('web_port', 9000))
-    backend_port = input(f"Backend port (default {default_port}): ").strip() or default_port
-    cert_path = input("SSL certificate path (e.g., /etc/ssl/certs/domain.crt): ").strip()
-    key_path = input("SSL certificate key path (e.g., /etc/ssl/private/domain.key): ").strip()
+    backend_port = ask(f"Backend port (default {default_port}): ").strip() or default_port
+    cert_path = ask("SSL certificate path (e.g., /etc/ssl/certs/domain.crt): ").strip()
+    key_path = ask("SSL certificate key path (e.g., /etc/ssl/private/domain.key): ").strip()
     assets_path_default = str(REPO_DIR / "airline-web" / "public")
-    assets_path = input(f"Assets path (default {assets_path_default}): ").strip() or assets_path_default
+    assets_path = ask(f"Assets path (default {assets_path_default}): ").strip() or assets_path_default
     return op_setup_reverse_proxy_values(state, domain, backend_port, cert_path, key_path, assets_path)
 
 # New: trusted hosts configuration
@@ -612,7 +917,7 @@ def op_config_trusted_hosts_value(state, hosts_str):
 
 def op_config_trusted_hosts(state):
     default_hosts = "localhost, 127.0.0.1"
-    hosts_input = input(f"Enter comma-separated trusted hosts (default: {default_hosts}): ").strip()
+    hosts_input = ask(f"Enter comma-separated trusted hosts (default: {default_hosts}): ").strip()
     if not hosts_input:
         hosts_input = default_hosts
     return op_config_trusted_hosts_value(state, hosts_input)
@@ -637,7 +942,7 @@ def op_full_install(state):
     if not op_clone_repo(state):
         log("Clone/update failed; continuing for troubleshooting.")
     # Branch selection
-    branch = input(f"Branch or tag to checkout (default {state['config'].get('branch','master')}): ").strip() or state['config'].get('branch','master')
+    branch = ask(f"Branch or tag to checkout (default {state['config'].get('branch','master')}): ").strip() or state['config'].get('branch','master')
     state['config']['branch'] = branch
     save_state(state)
     if not op_checkout_version(state):
@@ -661,6 +966,1299 @@ def op_full_install(state):
     log("Full installation and configuration completed. Review logs for any errors.")
     return True
 
+# --- Database maintenance ---
+
+def _mysql_args(sql, state, db=True):
+    cfg = state["config"]
+    args = ["mysql", "-u", cfg["db_user"], "-N", "-B"]
+    if cfg.get("db_pass"):
+        args.append(f"-p{cfg['db_pass']}")
+    if db:
+        args.append(cfg["db_name"])
+    return args + ["-e", sql]
+
+
+def _mysql_query(sql, state, db=True):
+    """Run SQL as the service account and return (returncode, rows) with tab-separated columns."""
+    args = _mysql_args(sql, state, db)
+    p = subprocess.run(args, cwd=str(WORKDIR), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if p.returncode != 0:
+        log(f"MySQL query failed: {p.stderr.strip()}")
+        return p.returncode, []
+    rows = [line.split("\t") for line in p.stdout.splitlines() if line]
+    return 0, rows
+
+
+def _mysql_scalar(sql, state, default=None):
+    code, rows = _mysql_query(sql, state)
+    if code != 0 or not rows or rows[0][0] == "NULL":
+        return default
+    return rows[0][0]
+
+
+def _parse_flags(args):
+    # "--name value" / "--flag" pairs into a dict; positional args are returned separately
+    flags, positional = {}, []
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a.startswith("--"):
+            name = a[2:].replace("-", "_")
+            if "=" in name:
+                name, value = name.split("=", 1)
+                flags[name] = value
+            elif i + 1 < len(args) and not args[i + 1].startswith("--"):
+                flags[name] = args[i + 1]
+                i += 1
+            else:
+                flags[name] = True
+        else:
+            positional.append(a)
+        i += 1
+    return flags, positional
+
+
+def simulation_cycle_running():
+    """True while MainSimulation is between "cycle N starting!" and "cycle N spent" in its log."""
+    pid_file = PID_DIR / "simulation.pid"
+    if not pid_file.exists():
+        return False
+    try:
+        if not _pid_alive(int(pid_file.read_text().strip())):
+            return False
+    except ValueError:
+        return False
+    log_path = LOG_DIR / "simulation.log"
+    if not log_path.exists():
+        return False
+    import re
+    marker = re.compile(rb"cycle \d+ (starting!|spent )")
+    chunk = 256 * 1024
+    # A cycle can print far more than one chunk after "starting!", so walk back until
+    # the latest marker; the carried-over head covers a marker split across chunks
+    with log_path.open("rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        carry = b""
+        while pos > 0:
+            start = max(0, pos - chunk)
+            f.seek(start)
+            buf = f.read(pos - start) + carry
+            found = None
+            for found in marker.finditer(buf):
+                pass
+            if found:
+                return found.group(1) == b"starting!"
+            carry = buf[:64]
+            pos = start
+    return False
+
+
+# Retention policy per table. "cycle" tables keep the last N cycles of rows keyed by
+# (cycle, link); "rotated" tables are the passenger_history_<n> copies the simulation
+# renames every cycle, of which the last N are kept.
+RETENTION_DEFAULTS = {
+    "link_consumption": {"kind": "cycle", "keep": 300, "key": ["cycle", "link"]},
+    "passenger_history": {"kind": "rotated", "keep": 30},
+}
+
+ARCHIVE_DIR = WORKDIR / "archive"
+
+
+def _retention_policy(state):
+    policy = {name: dict(p) for name, p in RETENTION_DEFAULTS.items()}
+    for name, keep in state["config"].get("retention", {}).items():
+        if name in policy:
+            policy[name]["keep"] = int(keep)
+    return policy
+
+
+def _wait_for_simulation_idle(poll=10):
+    if not simulation_cycle_running():
+        return
+    log("Simulation cycle in progress; pruning paused...")
+    while simulation_cycle_running():
+        time.sleep(poll)
+    log("Simulation cycle finished; resuming pruning.")
+
+
+def _archive_rows(path, sql, state, append=True):
+    """Stream the result of sql into a gzip file; mysql output is copied as it arrives, never held in memory."""
+    import gzip
+    with gzip.open(path, "ab" if append else "wb") as f:
+        p = subprocess.Popen(_mysql_args(sql, state), cwd=str(WORKDIR), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        shutil.copyfileobj(p.stdout, f, 1024 * 1024)
+        err = p.stderr.read().decode(errors="replace").strip()
+        p.wait()
+    if p.returncode != 0:
+        log(f"MySQL query failed: {err}")
+        return False
+    return True
+
+
+def _prune_cycle_table(state, table, policy, batch, sleep, archive, dry_run):
+    first, second = policy["key"]
+    latest = _mysql_scalar(f"SELECT MAX({first}) FROM {table}", state)
+    if latest is None:
+        log(f"{table}: empty or unreadable, nothing to prune.")
+        return 0
+    cutoff = int(latest) - policy["keep"]
+    total = int(_mysql_scalar(f"SELECT COUNT(*) FROM {table} WHERE {first} <= {cutoff}", state, 0))
+    log(f"{table}: latest cycle {latest}, keeping {policy['keep']} cycles, {total} rows at or before cycle {cutoff}.")
+    if dry_run or total == 0:
+        return 0
+
+    archive_path = None
+    if archive:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        archive_path = ARCHIVE_DIR / f"{table}_{time.strftime('%Y%m%d%H%M%S')}_upto_{cutoff}.tsv.gz"
+        log(f"{table}: archiving pruned rows to {archive_path}")
+
+    deleted = 0
+    started = time.time()
+    while True:
+        _wait_for_simulation_idle()
+        # Upper primary key of this batch; walking the key in order keeps each DELETE a short range scan
+        code, rows = _mysql_query(
+            f"SELECT {first}, {second} FROM {table} WHERE {first} <= {cutoff} "
+            f"ORDER BY {first}, {second} LIMIT 1 OFFSET {batch - 1}", state)
+        if code != 0:
+            break
+        if rows:
+            hi_first, hi_second = rows[0]
+            where = (f"{first} <= {cutoff} AND ({first} < {hi_first} OR "
+                     f"({first} = {hi_first} AND {second} <= {hi_second}))")
+        else:
+            where = f"{first} <= {cutoff}"
+        if archive_path and not _archive_rows(archive_path, f"SELECT * FROM {table} WHERE {where} ORDER BY {first}, {second}", state):
+            log(f"{table}: archive failed; stopping before deleting unarchived rows.")
+            break
+        count = _mysql_scalar(f"DELETE FROM {table} WHERE {where} ORDER BY {first}, {second}; SELECT ROW_COUNT();", state)
+        if count is None:
+            break
+        deleted += int(count)
+        pct = 100.0 * deleted / total if total else 100.0
+        log(f"{table}: deleted {deleted}/{total} rows ({pct:.1f}%, {time.time() - started:.0f}s elapsed)")
+        if not rows or int(count) == 0:
+            break
+        time.sleep(sleep)
+    return deleted
+
+
+def _prune_rotated_tables(state, table, policy, archive, dry_run):
+    code, rows = _mysql_query(f"SHOW TABLES LIKE '{table}\\_%'", state)
+    if code != 0:
+        return 0
+    stale = []
+    for (name,) in rows:
+        suffix = name[len(table) + 1:]
+        if suffix.isdigit() and int(suffix) > policy["keep"]:
+            stale.append((int(suffix), name))
+    stale.sort()
+    log(f"{table}: keeping {policy['keep']} rotated copies, {len(stale)} older copies found.")
+    if dry_run:
+        return 0
+    dropped = 0
+    for n, name in stale:
+        _wait_for_simulation_idle()
+        if archive:
+            cycle = _mysql_scalar("SELECT cycle FROM cycle", state)
+            if cycle is None:
+                log(f"{table}: cannot read the current cycle; stopping before archiving.")
+                break
+            ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+            # Copy n was rotated out n cycles ago; the suffix shifts every cycle, the cycle number does not
+            path = ARCHIVE_DIR / f"{table}_cycle{int(cycle) - n}.tsv.gz"
+            # Written whole, so a rerun after an interrupted drop replaces rather than duplicates it
+            if not _archive_rows(path, f"SELECT * FROM {name}", state, append=False):
+                log(f"{name}: archive failed; skipping drop.")
+                continue
+            # A cycle during a long archive renames every copy, so the name may now hold other data
+            _wait_for_simulation_idle()
+            if _mysql_scalar("SELECT cycle FROM cycle", state) != cycle:
+                log(f"{name}: simulation rotated tables during the archive; stopping, run prune again.")
+                break
+        # Rotated copies are whole tables, so dropping is cheaper than any batched DELETE
+        if _mysql_query(f"DROP TABLE IF EXISTS {name}", state)[0] == 0:
+            dropped += 1
+            log(f"{table}: dropped {name} ({dropped}/{len(stale)})")
+    return dropped
+
+
+def op_db_prune(state, table=None, batch=5000, sleep=0.5, archive=False, dry_run=False):
+    policy = _retention_policy(state)
+    tables = [table] if table else list(policy)
+    for name in tables:
+        if name not in policy:
+            log(f"No retention policy for table: {name} (known: {', '.join(policy)})")
+            return False
+    log(f"Pruning {', '.join(tables)} (batch={batch}, sleep={sleep}s, archive={archive}, dry_run={dry_run})...")
+    for name in tables:
+        p = policy[name]
+        if p["kind"] == "cycle":
+            n = _prune_cycle_table(state, name, p, int(batch), float(sleep), archive, dry_run)
+            log(f"{name}: {n} rows removed.")
+        else:
+            n = _prune_rotated_tables(state, name, p, archive, dry_run)
+            log(f"{name}: {n} tables removed.")
+    log("Prune completed.")
+    return True
+
+
+def op_db_set_retention(state, table, keep):
+    if table not in RETENTION_DEFAULTS:
+        log(f"No retention policy for table: {table} (known: {', '.join(RETENTION_DEFAULTS)})")
+        return False
+    state["config"].setdefault("retention", {})[table] = int(keep)
+    save_state(state)
+    log(f"Retention for {table} set to {keep}.")
+    return True
+
+
+MYSQL_DROPIN_NAME = "99-airline-manager.cnf"
+MYSQL_DROPIN_DIRS = [
+    Path("/etc/mysql/mariadb.conf.d"),
+    Path("/etc/mysql/conf.d"),
+    Path("/etc/my.cnf.d"),
+]
+
+# innodb_flush_log_at_trx_commit per durability level:
+# full = flush+sync every commit, balanced = write every commit and sync once a second
+# (survives a mysqld crash, may lose ~1s on an OS crash), fast = write and sync once a second
+DURABILITY_LEVELS = {"full": 1, "balanced": 2, "fast": 0}
+
+
+def _host_memory_mb():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+def _jvm_budget_mb(state):
+    # -Xmx from SBT_OPTS/JAVA_OPTS (as set in the Docker image) or config, for web + simulation,
+    # plus a quarter again for metaspace, code cache and thread stacks
+    import re
+    heap = int(state["config"].get("jvm_heap_mb", 2048))
+    m = re.search(r"-Xmx(\d+)([mMgG])", os.environ.get("SBT_OPTS", "") or os.environ.get("JAVA_OPTS", ""))
+    if m:
+        heap = int(m.group(1)) * (1024 if m.group(2) in "gG" else 1)
+    count = int(state["config"].get("jvm_count", 2))
+    return count * heap * 5 // 4
+
+
+def mysql_tuning_profile(total_mb, jvm_mb, durability="balanced", max_connections=200):
+    """Server settings sized from the memory left over after the JVMs and an OS reserve."""
+    reserve = max(512, total_mb // 10)
+    avail = max(0, total_mb - jvm_mb - reserve)
+    # Buffer pool in 128M chunks (the default innodb_buffer_pool_chunk_size)
+    pool = max(128, (avail * 70 // 100) // 128 * 128)
+    instances = max(1, min(8, pool // 1024))
+    redo = min(2048, max(256, pool // 4 // 64 * 64))
+    tmp = 128 if avail >= 4096 else 64
+    return {
+        "innodb_buffer_pool_size": f"{pool}M",
+        # Removed in MariaDB 10.6; "loose-" keeps servers that do not know it starting
+        "loose-innodb_buffer_pool_instances": str(instances),
+        "innodb_log_file_size": f"{redo}M",
+        "innodb_flush_method": "O_DIRECT",
+        "innodb_flush_log_at_trx_commit": str(DURABILITY_LEVELS[durability]),
+        "tmp_table_size": f"{tmp}M",
+        "max_heap_table_size": f"{tmp}M",
+        "max_connections": str(max_connections),
+    }
+
+
+def render_mysql_dropin(settings, note=""):
+    lines = ["# Managed by airline_manager.py (db tune); changes here are overwritten."]
+    if note:
+        lines.append(f"# {note}")
+    lines.append("[mysqld]")
+    lines += [f"{k} = {v}" for k, v in settings.items()]
+    return "\n".join(lines) + "\n"
+
+
+def _mysql_dropin_path():
+    for d in MYSQL_DROPIN_DIRS:
+        if d.exists():
+            return d / MYSQL_DROPIN_NAME
+    return MYSQL_DROPIN_DIRS[1] / MYSQL_DROPIN_NAME
+
+
+def _to_bytes(value):
+    v = str(value).strip()
+    mult = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(v[-1:].upper())
+    return int(v[:-1]) * mult if mult else int(v)
+
+
+def _mysql_live_settings(state, names):
+    names = [n.replace("loose-", "") for n in names]
+    in_list = ", ".join(f"'{n}'" for n in names)
+    code, rows = _mysql_query(f"SHOW GLOBAL VARIABLES WHERE Variable_name IN ({in_list})", state, db=False)
+    return {r[0]: r[1] for r in rows if len(r) > 1} if code == 0 else {}
+
+
+def _verify_mysql_settings(state, settings):
+    live = _mysql_live_settings(state, list(settings))
+    ok = True
+    for key, want in settings.items():
+        name = key.replace("loose-", "")
+        have = live.get(name)
+        if have is None:
+            if not key.startswith("loose-"):
+                log(f"Verify: {name} not reported by server")
+                ok = False
+            continue
+        if want[-1:] in ("K", "M", "G"):
+            # The server rounds some sizes up to its chunk size
+            match = _to_bytes(have) >= _to_bytes(want)
+        else:
+            match = have.upper() == want.upper()
+        log(f"Verify: {name} = {have} (wanted {want}){'' if match else ' MISMATCH'}")
+        ok = ok and match
+    return ok
+
+
+def _restart_mysql():
+    code = run("systemctl restart mariadb || systemctl restart mysql || service mariadb restart || service mysql restart", use_sudo=True)
+    if code != 0:
+        return False
+    for _ in range(60):
+        if subprocess.run(["mysqladmin", "ping", "--silent"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+            return True
+        time.sleep(1)
+    return False
+
+
+def op_db_tune(state, durability=None, max_connections=None, dry_run=False):
+    import difflib
+    cfg = state["config"]
+    durability = durability or cfg.get("db_durability", "balanced")
+    if durability not in DURABILITY_LEVELS:
+        log(f"Unknown durability level: {durability} (choose {', '.join(DURABILITY_LEVELS)})")
+        return False
+    max_connections = int(max_connections or cfg.get("db_max_connections", 200))
+    total = _host_memory_mb()
+    jvm = _jvm_budget_mb(state)
+    settings = mysql_tuning_profile(total, jvm, durability, max_connections)
+    note = f"host {total}M, JVM budget {jvm}M, durability {durability}"
+    content = render_mysql_dropin(settings, note)
+    path = _mysql_dropin_path()
+    current = path.read_text() if path.exists() else ""
+    log(f"MySQL tuning profile ({note}) -> {path}")
+
+    if dry_run:
+        diff = difflib.unified_diff(current.splitlines(True), content.splitlines(True), str(path), str(path) + " (proposed)")
+        sys.stdout.write("".join(diff) or "Drop-in already up to date.\n")
+        live = _mysql_live_settings(state, list(settings))
+        for key, want in settings.items():
+            name = key.replace("loose-", "")
+            print(f"  {name}: live {live.get(name, '?')} -> {want}")
+        return True
+
+    if current == content:
+        log("Drop-in already up to date; verifying live settings.")
+        return _verify_mysql_settings(state, settings)
+
+    staged = WORKDIR / MYSQL_DROPIN_NAME
+    staged.write_text(content)
+    if run(f"install -m 644 '{staged}' '{path}'", use_sudo=True) != 0:
+        log(f"Failed to install {path}")
+        staged.unlink()
+        return False
+
+    def restore_previous():
+        if current:
+            staged.write_text(current)
+            run(f"install -m 644 '{staged}' '{path}'", use_sudo=True)
+        else:
+            run(f"rm -f '{path}'", use_sudo=True)
+
+    # The web and simulation JVMs hold pooled connections that would break mid-request or
+    # mid-cycle, so stop them for the restart and bring back whichever were running
+    _wait_for_simulation_idle()
+    running = [name for name in ("simulation", "web") if service_pid(name)]
+    stopped = []
+    for name in running:
+        log(f"Stopping {name} for the MySQL restart...")
+        if not (op_stop_web(state) if name == "web" else op_stop_simulation()):
+            break
+        stopped.append(name)
+    if stopped != running:
+        log("Could not stop all services; leaving MySQL running with the previous settings.")
+        restore_previous()
+        ok = False
+    else:
+        log("Restarting MySQL/MariaDB to apply settings...")
+        ok = _restart_mysql()
+        if not ok:
+            log("Server did not come back with the new settings; restoring previous drop-in.")
+            restore_previous()
+            _restart_mysql()
+    staged.unlink()
+    for name in reversed(stopped):
+        log(f"Starting {name} again...")
+        if name == "web":
+            op_start_web(state)
+        else:
+            op_start_simulation(state)
+    if not ok:
+        return False
+    cfg["db_durability"] = durability
+    cfg["db_max_connections"] = max_connections
+    save_state(state)
+    ok = _verify_mysql_settings(state, settings)
+    log("db tune completed." if ok else "db tune applied but some settings did not take effect.")
+    return ok
+
+
+SLOWLOG_HEADER_PREFIXES = ("Tcp port:", "Time ", "use ")
+# Session state the server logs ahead of a statement, e.g. "SET insert_id=5,timestamp=1697709601;"
+SLOWLOG_SET_LINE = r"^SET (?:last_insert_id|insert_id|timestamp)=[^;]*;$"
+
+
+def _sudo_output(args):
+    p = subprocess.run(["sudo"] + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return p.stdout if p.returncode == 0 else None
+
+
+@contextlib.contextmanager
+def _open_log(path):
+    """Open a plain or compressed log as text, reading through sudo when the manager user cannot."""
+    import io
+    path = Path(path)
+    proc = None
+    try:
+        raw = path.open("rb")
+    except PermissionError:
+        # The datadir and /var/log/mysql are not readable by the manager user
+        proc = subprocess.Popen(["sudo", "cat", str(path)], stdout=subprocess.PIPE)
+        raw = proc.stdout
+    try:
+        if path.suffix == ".gz":
+            import gzip
+            f = gzip.open(raw, "rt", errors="replace")
+        elif path.suffix == ".bz2":
+            import bz2
+            f = bz2.open(raw, "rt", errors="replace")
+        elif path.suffix == ".xz":
+            import lzma
+            f = lzma.open(raw, "rt", errors="replace")
+        else:
+            f = io.TextIOWrapper(raw, errors="replace")
+        yield f
+    finally:
+        raw.close()
+        if proc and proc.wait() != 0:
+            raise PermissionError(f"cannot read {path}, even through sudo")
+
+
+def slowlog_files(path, rotated=True):
+    """The log at path plus, if rotated, its logrotate siblings (path.1, path.2.gz, ...), oldest first."""
+    path = Path(path)
+    want_siblings = rotated and path.suffix not in (".gz", ".bz2", ".xz") and not path.suffix[1:].isdigit()
+    try:
+        if not path.exists():
+            return []
+        names = [p.name for p in path.parent.glob(path.name + ".*")] if want_siblings else []
+    except PermissionError:
+        if _sudo_output(["test", "-e", str(path)]) is None:
+            return []
+        listing = (_sudo_output(["ls", "-1", str(path.parent)]) or "") if want_siblings else ""
+        names = [n for n in listing.splitlines() if n.startswith(path.name + ".")]
+    siblings = []
+    for name in names:
+        n = name[len(path.name) + 1:].split(".")[0]
+        if n.isdigit():
+            siblings.append((int(n), path.parent / name))
+    return [p for _, p in sorted(siblings, reverse=True)] + [path]
+
+
+def iter_slowlog_entries(lines):
+    """Yield {"query_time", "rows_sent", "rows_examined", "sql"} from MySQL/MariaDB slow log lines."""
+    import re
+    meta, sql = {}, []
+
+    def flush():
+        if sql and "query_time" in meta:
+            yield {
+                "query_time": meta["query_time"],
+                "rows_sent": meta.get("rows_sent", 0),
+                "rows_examined": meta.get("rows_examined", 0),
+                "sql": "\n".join(sql),
+            }
+
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("#"):
+            if sql:
+                yield from flush()
+                meta, sql = {}, []
+            for key, value in re.findall(r"(\w+): +(\S+)", line):
+                key = key.lower()
+                if key in ("query_time", "rows_sent", "rows_examined"):
+                    try:
+                        meta[key] = float(value) if key == "query_time" else int(value)
+                    except ValueError:
+                        pass
+        elif (line.strip() and not line.startswith(SLOWLOG_HEADER_PREFIXES) and ", Version: " not in line
+              and not re.match(SLOWLOG_SET_LINE, line.strip())):
+            sql.append(line.strip())
+    yield from flush()
+
+
+def _collapse_values(s):
+    """Replace each "values (...), (...)" list with "values (?+)", matching parentheses so that
+    rows holding function calls such as now() or coalesce(?, ?) collapse too."""
+    import re
+    out, pos = [], 0
+    # "= values(col)" in ON DUPLICATE KEY UPDATE is a column reference, not a row list
+    for m in re.finditer(r"(?<!= )\bvalues? ?\(", s):
+        if m.start() < pos:
+            continue
+        i, end = m.end() - 1, None
+        while i < len(s) and s[i] == "(":
+            depth = 0
+            for j in range(i, len(s)):
+                depth += {"(": 1, ")": -1}.get(s[j], 0)
+                if depth == 0:
+                    break
+            if depth:
+                break
+            end = j + 1
+            rest = re.match(r" ?, ?(?=\()", s[end:])
+            i = end + rest.end() if rest else len(s)
+        if end is not None:
+            out += [s[pos:m.start()], "values (?+)"]
+            pos = end
+    return "".join(out) + s[pos:]
+
+
+def slowlog_fingerprint(sql):
+    """Normalize a query so executions differing only in literals group together."""
+    import re
+    s = re.sub(r"/\*.*?\*/", " ", sql, flags=re.S)
+    s = re.sub(r"--[^\n]*", " ", s)
+    s = re.sub(r"'(?:[^'\\]|\\.|'')*'", "?", s)
+    s = re.sub(r'"(?:[^"\\]|\\.)*"', "?", s)
+    s = re.sub(r"\b0x[0-9a-fA-F]+\b", "?", s)
+    s = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", "?", s, flags=re.I)
+    s = re.sub(r"\s+", " ", s).strip().lower().rstrip(";").strip()
+    s = re.sub(r"\bin \(\s*\?(?:\s*,\s*\?)*\s*\)", "in (?+)", s)
+    return _collapse_values(s)
+
+
+def _p95(times):
+    ordered = sorted(times)
+    return ordered[max(0, -(-len(ordered) * 95 // 100) - 1)] if ordered else 0.0
+
+
+def digest_slowlog(paths):
+    groups = {}
+    for path in paths:
+        with _open_log(path) as f:
+            for e in iter_slowlog_entries(f):
+                g = groups.setdefault(slowlog_fingerprint(e["sql"]), {
+                    "times": [], "rows_sent": 0, "rows_examined": 0, "sample": e["sql"],
+                })
+                g["times"].append(e["query_time"])
+                g["rows_sent"] += e["rows_sent"]
+                g["rows_examined"] += e["rows_examined"]
+    digest = {}
+    for fp, g in groups.items():
+        digest[fp] = {
+            "count": len(g["times"]),
+            "total": sum(g["times"]),
+            "p95": _p95(g["times"]),
+            "rows_sent": g["rows_sent"],
+            "rows_examined": g["rows_examined"],
+            "sample": g["sample"],
+        }
+    return digest
+
+
+def format_slowlog_digest(digest, top=20):
+    rows = sorted(digest.items(), key=lambda kv: kv[1]["total"], reverse=True)[:top]
+    grand = sum(d["total"] for d in digest.values()) or 1.0
+    out = [f"{'count':>7} {'total s':>9} {'%':>5} {'p95 s':>8} {'examined':>11} {'sent':>9} {'exam/sent':>9}  query"]
+    for fp, d in rows:
+        ratio = d["rows_examined"] / d["rows_sent"] if d["rows_sent"] else float(d["rows_examined"])
+        out.append(f"{d['count']:>7} {d['total']:>9.2f} {100 * d['total'] / grand:>5.1f} {d['p95']:>8.3f} "
+                   f"{d['rows_examined']:>11} {d['rows_sent']:>9} {ratio:>9.0f}  {fp[:120]}")
+    return "\n".join(out)
+
+
+def format_slowlog_comparison(before, after, top=20):
+    keys = set(before) | set(after)
+    empty = {"count": 0, "total": 0.0, "p95": 0.0}
+    rows = sorted(keys, key=lambda k: abs(after.get(k, empty)["total"] - before.get(k, empty)["total"]), reverse=True)[:top]
+    out = [f"{'count':>13} {'total s':>19} {'p95 s':>17} {'change':>8}  query"]
+    for fp in rows:
+        b, a = before.get(fp, empty), after.get(fp, empty)
+        if fp not in before:
+            change = "new"
+        elif fp not in after:
+            change = "gone"
+        else:
+            change = f"{100 * (a['total'] - b['total']) / b['total']:+.0f}%" if b["total"] else "n/a"
+        out.append(f"{b['count']:>6}>{a['count']:<6} {b['total']:>9.2f}>{a['total']:<9.2f} "
+                   f"{b['p95']:>8.3f}>{a['p95']:<8.3f} {change:>8}  {fp[:120]}")
+    return "\n".join(out)
+
+
+def op_db_slowlog_toggle(state, enabled, threshold=None, min_rows=None, no_index=False):
+    cfg = state["config"]
+    sqls = [f"SET GLOBAL slow_query_log = {'ON' if enabled else 'OFF'};"]
+    if enabled:
+        if threshold is not None:
+            sqls.append(f"SET GLOBAL long_query_time = {float(threshold)};")
+        if min_rows is not None:
+            sqls.append(f"SET GLOBAL min_examined_row_limit = {int(min_rows)};")
+        sqls.append(f"SET GLOBAL log_queries_not_using_indexes = {'ON' if no_index else 'OFF'};")
+    # SET GLOBAL needs SUPER, which the service account does not have
+    code = _mysql_exec(" ".join(sqls), cfg.get("mysql_root_user", "root"), cfg.get("mysql_root_pass", ""))
+    if code != 0:
+        log("Failed to change slow query log settings.")
+        return False
+    live = _mysql_live_settings(state, ["slow_query_log", "slow_query_log_file", "long_query_time",
+                                        "min_examined_row_limit", "log_queries_not_using_indexes"])
+    for k, v in live.items():
+        log(f"{k} = {v}")
+    if enabled:
+        log("long_query_time applies to connections opened after this change; restart web/simulation to cover their pools.")
+    return True
+
+
+def _slowlog_default_path(state):
+    live = _mysql_live_settings(state, ["slow_query_log_file", "datadir"])
+    path = live.get("slow_query_log_file", "")
+    if path and not os.path.isabs(path):
+        path = os.path.join(live.get("datadir", ""), path)
+    return path
+
+
+def op_db_slowlog_digest(state, paths, top=20):
+    if not paths:
+        default = _slowlog_default_path(state)
+        if not default:
+            log("Could not determine slow_query_log_file from the server; pass a path.")
+            return False
+        paths = [default]
+    files = [f for p in paths for f in slowlog_files(p)]
+    if not files:
+        log(f"No slow log found at {', '.join(paths)}")
+        return False
+    try:
+        digest = digest_slowlog(files)
+    except OSError as e:
+        log(f"Cannot read slow log: {e}. Copy the log somewhere readable or run as a sudo-capable user.")
+        return False
+    log(f"Slow log digest of {len(files)} file(s): {sum(d['count'] for d in digest.values())} queries, {len(digest)} fingerprints")
+    print(format_slowlog_digest(digest, top))
+    return True
+
+
+def op_db_slowlog_compare(before, after, top=20, rotated=False):
+    # Exactly the given files by default: a live log's rotated siblings hold older traffic
+    before_files, after_files = slowlog_files(before, rotated), slowlog_files(after, rotated)
+    if not before_files or not after_files:
+        log(f"Slow log capture not found: {before if not before_files else after}")
+        return False
+    try:
+        print(format_slowlog_comparison(digest_slowlog(before_files), digest_slowlog(after_files), top))
+    except OSError as e:
+        log(f"Cannot read slow log: {e}")
+        return False
+    return True
+
+
+def cli_db(state, args):
+    sub = args[0] if args else ""
+    flags, positional = _parse_flags(args[1:])
+    if sub == "prune":
+        return op_db_prune(
+            state,
+            table=flags.get("table"),
+            batch=flags.get("batch", 5000),
+            sleep=flags.get("sleep", 0.5),
+            archive=bool(flags.get("archive")),
+            dry_run=bool(flags.get("dry_run")),
+        )
+    if sub == "retention":
+        if len(positional) < 2:
+            for name, p in _retention_policy(state).items():
+                print(f"{name}: keep {p['keep']} ({p['kind']})")
+            return True
+        return op_db_set_retention(state, positional[0], positional[1])
+    if sub == "tune":
+        return op_db_tune(
+            state,
+            durability=flags.get("durability"),
+            max_connections=flags.get("max_connections"),
+            dry_run=bool(flags.get("dry_run")),
+        )
+    if sub == "slowlog":
+        action = positional[0] if positional else "digest"
+        top = int(flags.get("top", 20))
+        if action in ("on", "off"):
+            return op_db_slowlog_toggle(
+                state,
+                action == "on",
+                threshold=flags.get("threshold"),
+                min_rows=flags.get("min_rows"),
+                no_index=bool(flags.get("no_index")),
+            )
+        if action == "digest":
+            return op_db_slowlog_digest(state, positional[1:], top)
+        if action == "compare" and len(positional) == 3:
+            return op_db_slowlog_compare(positional[1], positional[2], top, rotated=bool(flags.get("rotated")))
+        log("Usage: db slowlog on|off|digest [files...]|compare <before> <after>")
+        return False
+    log(f"Unknown db command: {sub} (choose {', '.join(DB_SUBCOMMANDS)})")
+    return False
+
+
+# --- Load testing ---
+
+BENCH_DIR = WORKDIR / "benchmarks"
+
+# Each scenario is the request sequence one virtual user repeats over a keep-alive connection.
+# "auth" steps send HTTP Basic credentials, which is how airline-web's POST /login authenticates.
+LOADTEST_SCENARIOS = {
+    "read": [
+        {"method": "GET", "path": "/airlines"},
+        {"method": "GET", "path": "/airports?count=100"},
+        {"method": "GET", "path": "/airports/base/scale-details"},
+    ],
+    "login": [
+        {"method": "POST", "path": "/login", "auth": True},
+        {"method": "GET", "path": "/airlines?loginStatus=true"},
+        {"method": "GET", "path": "/airports?count=100"},
+    ],
+}
+
+
+def _hist_bucket(us):
+    # Log-linear buckets: exact below 128us, then 64 sub-buckets per power of two (<1.6% error)
+    if us < 128:
+        return us
+    shift = us.bit_length() - 7
+    return (us >> shift) << shift
+
+
+def hist_record(hist, seconds):
+    b = _hist_bucket(max(0, int(seconds * 1_000_000)))
+    hist[b] = hist.get(b, 0) + 1
+
+
+def hist_percentile(hist, pct):
+    total = sum(hist.values())
+    if not total:
+        return 0.0
+    rank = max(1, -(-total * pct // 100))
+    seen = 0
+    for b in sorted(hist):
+        seen += hist[b]
+        if seen >= rank:
+            return b / 1_000_000
+    return max(hist) / 1_000_000
+
+
+async def _http_request(conn, host, step, cookies, auth, timeout):
+    import asyncio
+    reader, writer = conn
+    headers = [f"{step['method']} {step['path']} HTTP/1.1", f"Host: {host}", "Connection: keep-alive",
+               "Accept: application/json", "Content-Length: 0"]
+    if step.get("auth") and auth:
+        headers.append(f"Authorization: Basic {auth}")
+    if cookies:
+        headers.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in cookies.items()))
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode())
+    await writer.drain()
+
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = None, False, True
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), timeout)).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        name, value = name.lower(), value.strip()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+        elif name == "connection" and value.lower() == "close":
+            keep_alive = False
+        elif name == "set-cookie":
+            k, _, v = value.split(";", 1)[0].partition("=")
+            cookies[k.strip()] = v.strip()
+    if chunked:
+        while True:
+            size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b";")[0], 16)
+            await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+            if size == 0:
+                break
+    elif length is not None:
+        await asyncio.wait_for(reader.readexactly(length), timeout)
+    else:
+        await asyncio.wait_for(reader.read(), timeout)
+        keep_alive = False
+    return status, keep_alive
+
+
+async def _close_connection(conn):
+    writer = conn[1]
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        # The peer may already have reset the connection; it is closed either way
+        pass
+
+
+async def _loadtest_run(url, steps, concurrency, rate, duration, auth, timeout):
+    import asyncio
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+    ssl = parts.scheme == "https" or None
+    host_header = parts.netloc
+    stats = {f"{s['method']} {s['path']}": {"hist": {}, "requests": 0, "errors": {}} for s in steps}
+    started = time.monotonic()
+    deadline = started + duration
+    slot = [0]
+
+    async def user():
+        conn, cookies = None, {}
+        try:
+            while True:
+                for step in steps:
+                    if rate:
+                        # Open-loop pacing: latency counts from the scheduled send time so a slow server
+                        # cannot hide queueing delay (coordinated omission)
+                        intended = started + slot[0] / rate
+                        slot[0] += 1
+                        if intended >= deadline:
+                            return
+                        await asyncio.sleep(max(0.0, intended - time.monotonic()))
+                    else:
+                        intended = time.monotonic()
+                        if intended >= deadline:
+                            return
+                    st = stats[f"{step['method']} {step['path']}"]
+                    st["requests"] += 1
+                    try:
+                        if conn is None:
+                            conn = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl), timeout)
+                        status, keep_alive = await _http_request(conn, host_header, step, cookies, auth, timeout)
+                        hist_record(st["hist"], time.monotonic() - intended)
+                        if status >= 400:
+                            st["errors"][str(status)] = st["errors"].get(str(status), 0) + 1
+                    except Exception as e:
+                        keep_alive = False
+                        name = type(e).__name__
+                        st["errors"][name] = st["errors"].get(name, 0) + 1
+                    if not keep_alive and conn is not None:
+                        await _close_connection(conn)
+                        conn = None
+        finally:
+            # Runs at the deadline too, so no keep-alive connection outlives the test
+            if conn is not None:
+                await _close_connection(conn)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return stats, time.monotonic() - started
+
+
+def loadtest_report(stats, elapsed):
+    report = {}
+    for endpoint, st in stats.items():
+        hist, errors = st["hist"], sum(st["errors"].values())
+        report[endpoint] = {
+            "requests": st["requests"],
+            "errors": st["errors"],
+            "error_rate": errors / st["requests"] if st["requests"] else 0.0,
+            "rps": st["requests"] / elapsed if elapsed else 0.0,
+            "p50": hist_percentile(hist, 50),
+            "p90": hist_percentile(hist, 90),
+            "p99": hist_percentile(hist, 99),
+            "p999": hist_percentile(hist, 99.9),
+            "max": max(hist) / 1_000_000 if hist else 0.0,
+            "histogram_us": {str(k): v for k, v in sorted(hist.items())},
+        }
+    return report
+
+
+def op_loadtest(state, scenario="read", url=None, concurrency=10, rate=None, duration=30,
+                user=None, password=None, timeout=10, save=True):
+    import asyncio
+    import base64
+    if scenario not in LOADTEST_SCENARIOS:
+        log(f"Unknown scenario: {scenario} (choose {', '.join(LOADTEST_SCENARIOS)})")
+        return False
+    cfg = state["config"]
+    url = url or f"http://127.0.0.1:{cfg.get('web_port', 9000)}"
+    steps = LOADTEST_SCENARIOS[scenario]
+    auth = None
+    if any(s.get("auth") for s in steps):
+        user = user or cfg.get("loadtest_user")
+        password = password or cfg.get("loadtest_pass", "")
+        if not user:
+            log("The login scenario needs --user/--password (or loadtest_user/loadtest_pass in manager_state.json).")
+            return False
+        auth = base64.b64encode(f"{user}:{password}".encode()).decode()
+    concurrency, duration = int(concurrency), float(duration)
+    rate = float(rate) if rate else None
+    log(f"Load test '{scenario}' against {url}: concurrency={concurrency}, "
+        f"rate={rate or 'unlimited'} req/s, duration={duration:.0f}s")
+    stats, elapsed = asyncio.run(_loadtest_run(url, steps, concurrency, rate, duration, auth, float(timeout)))
+    report = loadtest_report(stats, elapsed)
+
+    print(f"{'endpoint':<36} {'reqs':>7} {'rps':>7} {'err%':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8}")
+    for endpoint, r in report.items():
+        print(f"{endpoint:<36} {r['requests']:>7} {r['rps']:>7.1f} {100 * r['error_rate']:>6.2f} "
+              f"{1000 * r['p50']:>8.1f} {1000 * r['p90']:>8.1f} {1000 * r['p99']:>8.1f} "
+              f"{1000 * r['p999']:>9.1f} {1000 * r['max']:>8.1f}")
+        if r["errors"]:
+            print(f"{'':<36} errors: {r['errors']}")
+
+    if save:
+        BENCH_DIR.mkdir(parents=True, exist_ok=True)
+        out = BENCH_DIR / f"loadtest_{scenario}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with out.open("w") as f:
+            json.dump({
+                "scenario": scenario, "url": url, "concurrency": concurrency, "rate": rate,
+                "duration": elapsed, "started": time.strftime("%Y-%m-%d %H:%M:%S"), "endpoints": report,
+            }, f, indent=2)
+        log(f"Load test results saved to {out}")
+    return True
+
+
+# --- Plans ---
+
+def load_plan(path):
+    """Read a JSON or YAML plan; YAML needs PyYAML installed in the manager's venv."""
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix in (".yml", ".yaml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML plans need PyYAML (pip install pyyaml in .venv) or use a .json plan")
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+DB_SUBCOMMANDS = ("prune", "retention", "tune", "slowlog")
+SLOWLOG_ACTIONS = ("on", "off", "digest", "compare")
+
+
+def _flag_number_error(flags, name, kind=float, minimum=0):
+    if name not in flags:
+        return None
+    try:
+        value = kind(flags[name])
+    except (TypeError, ValueError):
+        return f"--{name.replace('_', '-')} must be a number"
+    if value < minimum:
+        return f"--{name.replace('_', '-')} must be at least {minimum}"
+    return None
+
+
+def validate_command(cmd, args):
+    """Check a command's subcommand, choices and numeric flags without running it; returns an error or None."""
+    flags, positional = _parse_flags(args)
+    checks = []
+    if cmd == "db":
+        sub = args[0]
+        flags, positional = _parse_flags(args[1:])
+        if sub not in DB_SUBCOMMANDS:
+            return f"unknown db command {sub!r} (choose {', '.join(DB_SUBCOMMANDS)})"
+        if sub == "prune":
+            if flags.get("table") not in (None, *RETENTION_DEFAULTS):
+                return f"no retention policy for table {flags['table']!r}"
+            checks = [("batch", int, 1), ("sleep", float, 0)]
+        elif sub == "retention":
+            if len(positional) not in (0, 2):
+                return "db retention takes no arguments or <table> <keep>"
+            if positional and positional[0] not in RETENTION_DEFAULTS:
+                return f"no retention policy for table {positional[0]!r}"
+            if positional and not positional[1].isdigit():
+                return "retention keep must be a whole number"
+        elif sub == "tune":
+            if flags.get("durability") not in (None, *DURABILITY_LEVELS):
+                return f"unknown durability {flags['durability']!r} (choose {', '.join(DURABILITY_LEVELS)})"
+            checks = [("max_connections", int, 1)]
+        elif sub == "slowlog":
+            action = positional[0] if positional else "digest"
+            if action not in SLOWLOG_ACTIONS:
+                return f"unknown slowlog action {action!r} (choose {', '.join(SLOWLOG_ACTIONS)})"
+            if action == "compare" and len(positional) != 3:
+                return "db slowlog compare takes <before> <after>"
+            checks = [("top", int, 1), ("threshold", float, 0), ("min_rows", int, 0)]
+    elif cmd == "restart":
+        if positional and (len(positional) > 1 or positional[0] not in RESTART_TARGETS):
+            return f"restart takes one of {', '.join(RESTART_TARGETS)}"
+        checks = [("wait", float, 0)]
+    elif cmd == "loadtest":
+        if flags.get("scenario", "read") not in LOADTEST_SCENARIOS:
+            return f"unknown loadtest scenario {flags['scenario']!r} (choose {', '.join(LOADTEST_SCENARIOS)})"
+        checks = [("concurrency", int, 1), ("rate", float, 0.001), ("duration", float, 0.001), ("timeout", float, 0.001)]
+    for name, kind, minimum in checks:
+        err = _flag_number_error(flags, name, kind, minimum)
+        if err:
+            return err
+    return None
+
+
+def _command_writes_state(cmd, args):
+    """Whether a command may change manager_state.json; only read-only steps can run in parallel."""
+    if cmd in ("start_web", "stop_web", "start_simulation", "stop_simulation", "restart", "loadtest"):
+        return False
+    if cmd == "db":
+        flags, positional = _parse_flags(args[1:])
+        if args[0] == "prune" or (args[0] == "retention" and not positional):
+            return False
+        if args[0] == "slowlog":
+            return False
+    return True
+
+
+def validate_plan(plan):
+    """Return (steps, errors); steps are normalized to name/command/args/parallel dicts."""
+    if isinstance(plan, list):
+        plan = {"steps": plan}
+    if not isinstance(plan, dict) or not isinstance(plan.get("steps"), list) or not plan["steps"]:
+        return [], ["plan must be a list of steps or an object with a non-empty 'steps' list"]
+    steps, errors = [], []
+    for i, raw in enumerate(plan["steps"], 1):
+        if isinstance(raw, str):
+            raw = {"command": raw}
+        if not isinstance(raw, dict):
+            errors.append(f"step {i}: must be an object or a command name")
+            continue
+        cmd = raw.get("command")
+        args = raw.get("args", [])
+        if not isinstance(args, list) or any(isinstance(a, (dict, list)) for a in args):
+            errors.append(f"step {i}: args must be a list of strings")
+            continue
+        args = [str(a) for a in args]
+        if cmd not in CLI_COMMANDS:
+            errors.append(f"step {i}: unknown command {cmd!r}")
+            continue
+        lo, hi = CLI_COMMANDS[cmd]
+        if len(args) < lo or (hi is not None and len(args) > hi):
+            expected = f"{lo}" if lo == hi else f"{lo}-{hi if hi is not None else 'n'}"
+            errors.append(f"step {i}: {cmd} takes {expected} args, got {len(args)}")
+            continue
+        err = validate_command(cmd, args)
+        if err:
+            errors.append(f"step {i}: {err}")
+            continue
+        if raw.get("parallel") and _command_writes_state(cmd, args):
+            errors.append(f"step {i}: {cmd} changes manager state and cannot run in parallel")
+            continue
+        steps.append({
+            "name": str(raw.get("name") or f"{i}:{cmd}"),
+            "command": cmd,
+            "args": args,
+            "parallel": bool(raw.get("parallel", False)),
+        })
+    return steps, errors
+
+
+def _run_plan_step(state, step):
+    started = time.time()
+    error = None
+    try:
+        result = run_command(state, step["command"], step["args"])
+    except Exception as e:
+        result, error = False, str(e)
+    ok = result is True
+    return {
+        "name": step["name"],
+        "command": step["command"],
+        "args": step["args"],
+        "ok": ok,
+        "seconds": round(time.time() - started, 3),
+        "error": error,
+    }
+
+
+def op_run_plan(state, plan_path, report_path=None, validate_only=False):
+    """Run a plan of manager commands in this process, stopping at the first failure unless continue_on_error."""
+    global UNATTENDED
+    from concurrent.futures import ThreadPoolExecutor
+    if not plan_path:
+        log("Usage: run_plan <plan.json|plan.yaml> [--report <file>] [--validate]")
+        return False
+    try:
+        plan = load_plan(plan_path)
+    except (OSError, ValueError) as e:
+        log(f"Cannot read plan {plan_path}: {e}")
+        return False
+    steps, errors = validate_plan(plan)
+    for err in errors:
+        log(f"Plan error: {err}")
+    if errors:
+        return False
+    log(f"Plan {plan_path}: {len(steps)} steps validated.")
+    if validate_only:
+        return True
+
+    options = plan if isinstance(plan, dict) else {}
+    # Plan config overrides manager_state.json so prompts (root password, map key) have answers up front
+    if options.get("config"):
+        state["config"].update(options["config"])
+        save_state(state)
+    continue_on_error = bool(options.get("continue_on_error", False))
+    UNATTENDED = True
+
+    # Consecutive steps marked parallel run together; everything else runs in order
+    batches = []
+    for step in steps:
+        if step["parallel"] and batches and batches[-1][0]["parallel"]:
+            batches[-1].append(step)
+        else:
+            batches.append([step])
+
+    results, started, failed = [], time.time(), False
+    for batch in batches:
+        if failed and not continue_on_error:
+            results += [{"name": s["name"], "command": s["command"], "args": s["args"], "ok": False,
+                         "seconds": 0.0, "error": "skipped"} for s in batch]
+            continue
+        if len(batch) == 1:
+            log(f"Plan step {batch[0]['name']}")
+            batch_results = [_run_plan_step(state, batch[0])]
+        else:
+            log(f"Plan steps in parallel: {', '.join(s['name'] for s in batch)}")
+            with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+                batch_results = list(pool.map(lambda s: _run_plan_step(state, s), batch))
+        results += batch_results
+        failed = failed or not all(r["ok"] for r in batch_results)
+
+    ok = all(r["ok"] for r in results)
+    print(f"{'step':<28} {'result':<8} {'secs':>8}  detail")
+    for r in results:
+        status = "ok" if r["ok"] else ("skipped" if r["error"] == "skipped" else "FAILED")
+        detail = "" if r["error"] in (None, "skipped") else r["error"]
+        print(f"{r['name']:<28} {status:<8} {r['seconds']:>8.1f}  {detail}")
+    log(f"Plan {'completed' if ok else 'failed'} in {time.time() - started:.1f}s.")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump({"plan": str(plan_path), "ok": ok, "seconds": round(time.time() - started, 3),
+                       "steps": results}, f, indent=2)
+        log(f"Plan report written to {report_path}")
+    return ok
+
+
+# Commands available from the CLI and in plans, with (min, max) positional argument counts
+CLI_COMMANDS = {
+    "install_deps": (0, 0),
+    "full_install": (0, 0),
+    "clone": (0, 0),
+    "checkout": (0, 1),
+    "publish_local": (0, 0),
+    "init_db": (0, 0),
+    "start_web": (0, 0),
+    "stop_web": (0, 0),
+    "start_simulation": (0, 0),
+    "stop_simulation": (0, 0),
+    "set_map_key": (1, 1),
+    "config_host_port": (0, 2),
+    "config_banner": (0, 1),
+    "config_elasticsearch": (0, 3),
+    "config_trusted_hosts": (0, 1),
+    "setup_reverse_proxy": (1, 5),
+    "resume_next": (0, 0),
+    "uninstall": (0, 0),
+    "restart": (0, None),
+    "db": (1, None),
+    "loadtest": (0, None),
+}
+
+
+def run_command(state, cmd, args):
+    """Run one manager command; returns the operation's result (False on failure)."""
+    if cmd == "install_deps":
+        return op_install_deps(state)
+    elif cmd == "full_install":
+        return op_full_install(state)
+    elif cmd == "clone":
+        return op_clone_repo(state)
+    elif cmd == "checkout":
+        branch = args[0] if len(args) > 0 else state["config"].get("branch", "master")
+        state["config"]["branch"] = branch
+        save_state(state)
+        return op_checkout_version(state)
+    elif cmd == "publish_local":
+        return op_publish_local(state)
+    elif cmd == "init_db":
+        return op_create_db(state)
+    elif cmd == "start_web":
+        return op_start_web(state)
+    elif cmd == "stop_web":
+        return op_stop_web(state)
+    elif cmd == "start_simulation":
+        return op_start_simulation(state)
+    elif cmd == "stop_simulation":
+        return op_stop_simulation()
+    elif cmd == "set_map_key":
+        key = args[0] if len(args) > 0 else ""
+        return op_set_map_key_value(state, key)
+    elif cmd == "config_host_port":
+        host = args[0] if len(args) > 0 else "0.0.0.0"
+        port = args[1] if len(args) > 1 else "9000"
+        return op_config_host_port_values(state, host, port)
+    elif cmd == "config_banner":
+        val = args[0] if len(args) > 0 else "no"
+        return op_config_banner_value(state, val)
+    elif cmd == "config_elasticsearch":
+        enabled = args[0] if len(args) > 0 else "no"
+        es_host = args[1] if len(args) > 1 else "localhost"
+        es_port = args[2] if len(args) > 2 else "9200"
+        return op_config_elasticsearch_values(state, enabled, es_host, es_port)
+    elif cmd == "config_trusted_hosts":
+        hosts = args[0] if len(args) > 0 else "localhost,127.0.0.1"
+        return op_config_trusted_hosts_value(state, hosts)
+    elif cmd == "setup_reverse_proxy":
+        domain = args[0] if len(args) > 0 else ""
+        backend_port = args[1] if len(args) > 1 else str(state["config"].get("web_port", 9000))
+        cert_path = args[2] if len(args) > 2 else ""
+        key_path = args[3] if len(args) > 3 else ""
+        assets_path = args[4] if len(args) > 4 else None
+        return op_setup_reverse_proxy_values(state, domain, backend_port, cert_path, key_path, assets_path)
+    elif cmd == "resume_next":
+        return resume_next(state)
+    elif cmd == "uninstall":
+        return op_uninstall(state)
+    elif cmd == "restart":
+        flags, positional = _parse_flags(args)
+        return op_restart(state, positional[0] if positional else "all", flags.get("wait", 300))
+    elif cmd == "db":
+        return cli_db(state, args)
+    elif cmd == "loadtest":
+        flags, _ = _parse_flags(args)
+        return op_loadtest(
+            state,
+            scenario=flags.get("scenario", "read"),
+            url=flags.get("url"),
+            concurrency=flags.get("concurrency", 10),
+            rate=flags.get("rate"),
+            duration=flags.get("duration", 30),
+            user=flags.get("user"),
+            password=flags.get("password"),
+            timeout=flags.get("timeout", 10),
+            save=not flags.get("no_save"),
+        )
+    log(f"Unknown command: {cmd}")
+    return False
+
 
 def cli_main(argv):
     ensure_dirs()
@@ -670,60 +2268,12 @@ def cli_main(argv):
         return
     cmd = argv[0]
     try:
-        if cmd == "install_deps":
-            op_install_deps(state)
-        elif cmd == "full_install":
-            op_full_install(state)
-        elif cmd == "clone":
-            op_clone_repo(state)
-        elif cmd == "checkout":
-            branch = argv[1] if len(argv) > 1 else state["config"].get("branch", "master")
-            state["config"]["branch"] = branch
-            save_state(state)
-            op_checkout_version(state)
-        elif cmd == "publish_local":
-            op_publish_local(state)
-        elif cmd == "init_db":
-            op_create_db(state)
-        elif cmd == "start_web":
-            op_start_web(state)
-        elif cmd == "stop_web":
-            op_stop_web()
-        elif cmd == "start_simulation":
-            op_start_simulation(state)
-        elif cmd == "stop_simulation":
-            op_stop_simulation()
-        elif cmd == "set_map_key":
-            key = argv[1] if len(argv) > 1 else ""
-            op_set_map_key_value(state, key)
-        elif cmd == "config_host_port":
-            host = argv[1] if len(argv) > 1 else "0.0.0.0"
-            port = argv[2] if len(argv) > 2 else "9000"
-            op_config_host_port_values(state, host, port)
-        elif cmd == "config_banner":
-            val = argv[1] if len(argv) > 1 else "no"
-            op_config_banner_value(state, val)
-        elif cmd == "config_elasticsearch":
-            enabled = argv[1] if len(argv) > 1 else "no"
-            es_host = argv[2] if len(argv) > 2 else "localhost"
-            es_port = argv[3] if len(argv) > 3 else "9200"
-            op_config_elasticsearch_values(state, enabled, es_host, es_port)
-        elif cmd == "config_trusted_hosts":
-            hosts = argv[1] if len(argv) > 1 else "localhost,127.0.0.1"
-            op_config_trusted_hosts_value(state, hosts)
-        elif cmd == "setup_reverse_proxy":
-            domain = argv[1] if len(argv) > 1 else ""
-            backend_port = argv[2] if len(argv) > 2 else str(state["config"].get("web_port", 9000))
-            cert_path = argv[3] if len(argv) > 3 else ""
-            key_path = argv[4] if len(argv) > 4 else ""
-            assets_path = argv[5] if len(argv) > 5 else None
-            op_setup_reverse_proxy_values(state, domain, backend_port, cert_path, key_path, assets_path)
-        elif cmd == "resume_next":
-            resume_next(state)
-        elif cmd == "uninstall":
-            op_uninstall(state)
-        else:
-            log(f"Unknown command: {cmd}")
+        if cmd in ("run_plan", "run-plan"):
+            flags, positional = _parse_flags(argv[1:])
+            ok = op_run_plan(state, positional[0] if positional else "", report_path=flags.get("report"),
+                             validate_only=bool(flags.get("validate")))
+            sys.exit(0 if ok else 1)
+        run_command(state, cmd, argv[1:])
     except Exception as e:
         log(f"CLI error: {e}")
 
@@ -753,7 +2303,7 @@ def main():
         elif choice == "9":
             op_stop_simulation()
         elif choice == "10":
-            op_stop_web()
+            op_stop_web(state)
         elif choice == "11":
             op_set_map_key(state)
         elif choice == "12":
@@ -123,11 +123,19 @@ Advanced CLI usage:
 
 Commands (delegated to airline_manager.py):
   full_install | install_deps | clone | checkout <branch> | publish_local | init_db
-  start_web | stop_web | start_simulation | stop_simulation
+  start_web | stop_web | start_simulation | stop_simulation | restart [web|simulation|all] [--wait <secs>]
   set_map_key <key> | config_host_port <host> <port> | config_banner <yes|no>
   config_elasticsearch <enabled:yes|no> <host> <port> | config_trusted_hosts <hosts>
   setup_reverse_proxy <domain> <backend_port> <cert_path> <key_path> [assets_path]
   resume_next | uninstall
+  db prune [--table <name>] [--batch <rows>] [--sleep <secs>] [--archive] [--dry-run]
+  db retention [<table> <keep>]
+  db tune [--durability full|balanced|fast] [--max-connections <n>] [--dry-run]
+  db slowlog on [--threshold <secs>] [--min-rows <n>] [--no-index] | db slowlog off
+  db slowlog digest [files...] [--top <n>] | db slowlog compare <before> <after> [--rotated]
+  loadtest [--scenario read|login] [--url <url>] [--concurrency <n>] [--rate <req/s>] [--duration <secs>]
+           [--user <name> --password <pass>] [--timeout <secs>] [--no-save]
+  run_plan <plan.json|plan.yaml> [--report <file>] [--validate]
 
 Interactive menu:
   ./airline_manager.sh menu
@@ -216,7 +224,7 @@ main() {
       interactive_menu ;;
     full_install|install_deps|clone|publish_local|init_db|start_web|stop_web|start_simulation|stop_simulation|resume_next|uninstall)
       cmd="$1"; shift; run_manager "$cmd" "$@" ;;
-    checkout|set_map_key|config_host_port|config_banner|config_elasticsearch|config_trusted_hosts|setup_reverse_proxy)
+    checkout|set_map_key|config_host_port|config_banner|config_elasticsearch|config_trusted_hosts|setup_reverse_proxy|db|loadtest|run_plan|run-plan|restart)
       cmd="$1"; shift; run_manager "$cmd" "$@" ;;
     *)
       print_usage ;;
@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import airline_manager  # noqa: E402
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """airline_manager with its work, log and benchmark directories under tmp_path."""
+    for name in ("WORKDIR", "LOG_DIR", "PID_DIR", "BENCH_DIR", "ARCHIVE_DIR"):
+        monkeypatch.setattr(airline_manager, name, tmp_path / name.lower())
+    airline_manager.LOG_DIR.mkdir()
+    return airline_manager
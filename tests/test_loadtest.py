@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import json
+import socket
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+AUTH = base64.b64encode(b"pilot:secret").decode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """airline-web stand-in: /login sets PLAY_SESSION, scale-details fails, /airports is chunked."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"[]", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.path.startswith("/airports?"):
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (body[:1], body[1:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[("GET", self.path)] += 1
+            if "loginStatus" in self.path:
+                server.cookies.append(self.headers.get("Cookie"))
+        if self.path == "/airports/base/scale-details":
+            self.reply(500, b"boom")
+        else:
+            self.reply(200)
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.hits[("POST", self.path)] += 1
+        if self.path == "/login" and self.headers.get("Authorization") == f"Basic {AUTH}":
+            self.reply(200, b"{}", [("Set-Cookie", "PLAY_SESSION=abc123; Path=/; HTTPOnly")])
+        else:
+            self.reply(401)
+
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = Counter()
+    server.cookies = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", server
+    server.shutdown()
+    server.server_close()
+
+
+def run(manager, url, scenario, **kwargs):
+    args = dict(concurrency=2, rate=None, duration=0.5, auth=None, timeout=5)
+    args.update(kwargs)
+    return asyncio.run(manager._loadtest_run(url, manager.LOADTEST_SCENARIOS[scenario], **args))
+
+
+def test_read_scenario_counts_and_errors(manager, stub_url):
+    url, server = stub_url
+    stats, elapsed = run(manager, url, "read")
+    assert elapsed >= 0.5
+    for step in manager.LOADTEST_SCENARIOS["read"]:
+        st = stats[f"GET {step['path']}"]
+        assert st["requests"] > 0
+        assert st["requests"] == server.hits[("GET", step["path"])]
+        assert sum(st["hist"].values()) == st["requests"]
+    assert stats["GET /airlines"]["errors"] == {}
+    assert stats["GET /airports?count=100"]["errors"] == {}
+    scale = stats["GET /airports/base/scale-details"]
+    assert scale["errors"] == {"500": scale["requests"]}
+    report = manager.loadtest_report(stats, elapsed)
+    assert report["GET /airports/base/scale-details"]["error_rate"] == 1.0
+    assert report["GET /airlines"]["error_rate"] == 0.0
+
+
+def test_login_scenario_reuses_session_cookie(manager, stub_url):
+    url, server = stub_url
+    stats, _ = run(manager, url, "login", concurrency=1, duration=0.3, auth=AUTH)
+    assert stats["POST /login"]["errors"] == {}
+    assert server.cookies
+    assert set(server.cookies) == {"PLAY_SESSION=abc123"}
+
+
+def test_rate_limited_run(manager, stub_url):
+    url, server = stub_url
+    stats, _ = run(manager, url, "read", concurrency=4, rate=40, duration=0.5)
+    # One slot per request at 40/s over 0.5s, shared by all users
+    assert sum(st["requests"] for st in stats.values()) == 20
+    assert sum(server.hits.values()) == 20
+
+
+def test_refused_connection_is_an_error(manager):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    stats, _ = run(manager, f"http://127.0.0.1:{port}", "read", concurrency=1, rate=20, duration=0.3)
+    for st in stats.values():
+        assert st["requests"] > 0
+        assert st["hist"] == {}
+        assert st["errors"] == {"ConnectionRefusedError": st["requests"]}
+
+
+def test_op_loadtest_saves_report(manager, stub_url):
+    url, _ = stub_url
+    state = {"config": {"loadtest_user": "pilot", "loadtest_pass": "secret"}, "steps": {}}
+    assert manager.op_loadtest(state, scenario="login", url=url, concurrency=1, duration=0.3)
+    saved = list(manager.BENCH_DIR.glob("loadtest_login_*.json"))
+    assert len(saved) == 1
+    report = json.loads(saved[0].read_text())
+    assert set(report["endpoints"]) == {f"{s['method']} {s['path']}" for s in manager.LOADTEST_SCENARIOS["login"]}
+    assert report["endpoints"]["POST /login"]["errors"] == {}
+
+
+def test_histogram_buckets():
+    import airline_manager as m
+    assert m._hist_bucket(0) == 0
+    assert m._hist_bucket(127) == 127
+    assert m._hist_bucket(128) == 128
+    assert m._hist_bucket(129) == 128
+    assert m._hist_bucket(255) == 254
+    assert m._hist_bucket(259) == 256
+    # 64 sub-buckets per power of two: relative error stays under 1/64
+    for us in (1_000, 12_345, 999_999, 30_000_000):
+        assert 0 <= us - m._hist_bucket(us) < us / 64
+
+
+def test_histogram_percentiles():
+    import airline_manager as m
+    hist = {}
+    assert m.hist_percentile(hist, 50) == 0.0
+    for ms in range(1, 101):
+        m.hist_record(hist, ms / 1000)
+    assert sum(hist.values()) == 100
+    assert m.hist_percentile(hist, 50) == pytest.approx(0.050, rel=1 / 64)
+    assert m.hist_percentile(hist, 99) == pytest.approx(0.099, rel=1 / 64)
+    assert m.hist_percentile(hist, 99.9) == pytest.approx(0.100, rel=1 / 64)
+    assert m.hist_percentile(hist, 100) == m.hist_percentile(hist, 99.9)
+    m.hist_record(hist, -1)
+    assert min(hist) == 0
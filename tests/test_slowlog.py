@@ -0,0 +1,96 @@
+import gzip
+import shutil
+from pathlib import Path
+
+import pytest
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "slowlog"
+
+LINK_QUERY = "select * from link_consumption where cycle = ? and link = ?"
+HISTORY_INSERT = "insert into passenger_history_temp (passenger_type, cost) values (?+)"
+AIRPORT_QUERY = "select count(*) from airport where name like ?"
+CONSUMPTION_INSERT = "insert into link_consumption (cycle, link, price) values (?+)"
+
+
+def test_mysql8_digest(manager):
+    digest = manager.digest_slowlog([FIXTURES / "mysql8-slow.log"])
+    assert set(digest) == {LINK_QUERY, HISTORY_INSERT}
+    link = digest[LINK_QUERY]
+    assert link["count"] == 3
+    assert link["total"] == pytest.approx(7.0)
+    assert link["p95"] == pytest.approx(4.0)
+    assert (link["rows_sent"], link["rows_examined"]) == (60, 18000)
+    assert link["sample"] == "SELECT * FROM link_consumption WHERE cycle = 1200 AND link = 17;"
+
+
+def test_session_set_lines_are_not_part_of_the_query(manager):
+    entries = list(manager.iter_slowlog_entries((FIXTURES / "mysql8-slow.log").open()))
+    assert entries[-1]["sql"] == "INSERT INTO passenger_history_temp (passenger_type, cost) VALUES (1, 2.5), (2, 3.5);"
+    assert not any("SET " in e["sql"] or "use " in e["sql"] for e in entries)
+
+
+def test_mariadb_digest(manager):
+    digest = manager.digest_slowlog([FIXTURES / "mariadb-slow.log"])
+    assert set(digest) == {AIRPORT_QUERY, CONSUMPTION_INSERT}
+    airport = digest[AIRPORT_QUERY]
+    assert airport["count"] == 2
+    assert airport["total"] == pytest.approx(4.0)
+    assert airport["p95"] == pytest.approx(3.0)
+    assert (airport["rows_sent"], airport["rows_examined"]) == (2, 200000)
+    assert digest[CONSUMPTION_INSERT]["count"] == 1
+
+
+def test_rotated_gz_sibling_is_read_first(manager, tmp_path):
+    live = tmp_path / "slow.log"
+    shutil.copy(FIXTURES / "mysql8-slow.log", live)
+    with gzip.open(tmp_path / "slow.log.1.gz", "wb") as f:
+        f.write((FIXTURES / "mariadb-slow.log").read_bytes())
+    (tmp_path / "slow.log.bak").write_text("not a rotation")
+
+    files = manager.slowlog_files(live)
+    assert files == [tmp_path / "slow.log.1.gz", live]
+    assert manager.slowlog_files(live, rotated=False) == [live]
+
+    digest = manager.digest_slowlog(files)
+    assert set(digest) == {LINK_QUERY, HISTORY_INSERT, AIRPORT_QUERY, CONSUMPTION_INSERT}
+    assert digest[AIRPORT_QUERY]["count"] == 2
+
+
+def test_compare(manager):
+    before = manager.digest_slowlog([FIXTURES / "before-slow.log"])
+    after = manager.digest_slowlog([FIXTURES / "after-slow.log"])
+    changes = {}
+    for line in manager.format_slowlog_comparison(before, after).splitlines()[1:]:
+        columns, query = line.rsplit("  ", 1)
+        changes[query] = columns.split()[-1]
+    assert changes == {
+        "select * from airline where id = ?": "-80%",
+        "select * from link where airline = ?": "new",
+        "select * from cycle": "gone",
+    }
+
+
+def test_compare_ignores_rotated_siblings_by_default(manager, tmp_path, capsys):
+    before = tmp_path / "before.log"
+    shutil.copy(FIXTURES / "before-slow.log", before)
+    shutil.copy(FIXTURES / "mariadb-slow.log", tmp_path / "before.log.1")
+    assert manager.op_db_slowlog_compare(before, FIXTURES / "after-slow.log")
+    assert "airport" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("INSERT INTO t (a, b) VALUES (1, NOW()), (2, COALESCE(NULL, 3));", "insert into t (a, b) values (?+)"),
+    ("insert into t values (1)", "insert into t values (?+)"),
+    ("INSERT INTO t VALUES (1) ON DUPLICATE KEY UPDATE a = VALUES(a)",
+     "insert into t values (?+) on duplicate key update a = values(a)"),
+    ("SELECT * FROM t WHERE id IN (1, 2, 3) /* hint */", "select * from t where id in (?+)"),
+    ("SELECT 'it''s', \"x\", 0xFF, -1.5e3 FROM t", "select ?, ?, ?, ? from t"),
+])
+def test_fingerprint(manager, sql, expected):
+    assert manager.slowlog_fingerprint(sql) == expected
+
+
+def test_digest_without_server_path(manager, monkeypatch, capsys):
+    monkeypatch.setattr(manager, "_mysql_live_settings", lambda state, names: {})
+    assert manager.op_db_slowlog_digest({"config": {}}, []) is False
+    assert "pass a path" in capsys.readouterr().out